@@ -12,35 +12,53 @@
   GDRIVE_FOLDER_ID
   DRIVE_AUTH_MODE = oauth_only (권장)
 """
-import os, re, io, math, json, pytz, traceback
+import os, re, io, csv, math, json, traceback
 import datetime as dt
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from functools import lru_cache
+from operator import attrgetter
 from typing import List, Dict, Optional, Tuple
+from urllib.parse import urljoin, urlparse
 
 import requests
 import pandas as pd
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, SoupStrainer
 
-BEST_URL = "https://global.oliveyoung.com/display/page/best-seller?target=pillsTab1Nav1"
-KST = pytz.timezone("Asia/Seoul")
+SITE_ROOT = "https://global.oliveyoung.com"
+BEST_URL = f"{SITE_ROOT}/display/page/best-seller?target=pillsTab1Nav1"
+KST = dt.timezone(dt.timedelta(hours=9), "KST")  # DST 없음 → 고정 오프셋
+
+# 수집/Slack 요청이 커넥션 풀을 공유
+HTTP = requests.Session()
 
 # ---------- 시간/문자 유틸 ----------
 def now_kst(): return dt.datetime.now(KST)
-def today_kst_str(): return now_kst().strftime("%Y-%m-%d")
-def yesterday_kst_str(): return (now_kst() - dt.timedelta(days=1)).strftime("%Y-%m-%d")
+def today_kst_str(now=None): return (now or now_kst()).strftime("%Y-%m-%d")
+def yesterday_kst_str(now=None): return ((now or now_kst()) - dt.timedelta(days=1)).strftime("%Y-%m-%d")
 def build_filename(d): return f"올리브영글로벌_랭킹_{d}.csv"
-def clean_text(s): return re.sub(r"\s+", " ", (s or "")).strip()
+def abs_url(href: str) -> str:
+    # 절대경로/루트상대경로는 문자열 연산만, 그 외에만 urljoin
+    if not href or href.startswith(("http://", "https://")): return href
+    if href.startswith("/") and not href.startswith("//"): return SITE_ROOT + href
+    return urljoin(BEST_URL, href)
+def clean_text(s): return " ".join(s.split()) if s else ""  # 유니코드 공백(NBSP 포함) 정규화, 정규식 불필요
+NUM_RE = re.compile(r"\d+(?:\.\d+)?")
 def to_float(s):
+    # 첫 숫자만 필요 → findall 리스트 대신 search
     if not s: return None
-    m = re.findall(r"[\d]+(?:\.[\d]+)?", str(s)); return float(m[0]) if m else None
+    m = NUM_RE.search(str(s)); return float(m.group()) if m else None
 
 # ---------- 가격/표기 유틸 ----------
-PRICE_RE = re.compile(r"(?:US\$|\$)\s*([\d.,]+)")
+PRICE_RE = re.compile(r"(?:US\$|\$)\s*(\d[\d,]*(?:\.\d+)?|\.\d+)")  # 캡처는 항상 float 변환 가능 ("$.99" 포함)
+PRICE_TEXT_RE = re.compile(r"\d+(?:\.\d*)?|\.\d+")
 def parse_price_to_float(text: str) -> Optional[float]:
+    # 통화기호/콤마 제거 후 전체가 숫자일 때만 가격 ("30%" 같은 할인율 span은 None)
     if not text: return None
     t = text.replace("US$", "").replace("$", "").replace(",", "").strip()
-    try: return float(t)
-    except: return None
+    return float(t) if PRICE_TEXT_RE.fullmatch(t) else None
+
+def as_float(v) -> Optional[float]: return None if v is None else float(v)
 
 def fmt_currency_usd(v) -> str:
     try:
@@ -50,22 +68,31 @@ def fmt_currency_usd(v) -> str:
 
 def slack_escape(s): return s.replace("&","&amp;").replace("<","&lt;").replace(">","&gt;")
 
+@lru_cache(maxsize=256)
+def _brand_prefix_re(brand: str):
+    return re.compile(rf"^\[?\s*{re.escape(brand)}\b", re.I)
+
 def make_display_name(brand: str, product: str, include_brand: bool) -> str:
     product = clean_text(product); brand = clean_text(brand)
     if not include_brand or not brand: return product
-    if re.match(rf"^\[?\s*{re.escape(brand)}\b", product, flags=re.I): return product
+    # 흔한 경우("Brand 제품명")는 정규식 없이 판정
+    b, p = brand.lower(), product.lower()
+    if b[-1].isalnum() and (p == b or p.startswith(b + " ")): return product
+    if _brand_prefix_re(brand).match(product): return product
     return f"{brand} {product}"
 
 def discount_floor(orig: Optional[float], sale: Optional[float], percent_text: Optional[str]) -> Optional[int]:
     if percent_text:
         n = to_float(percent_text)
         if n is not None: return int(n // 1)
-    if orig and sale and orig > 0:
-        return max(0, int(math.floor((1 - sale / orig) * 100)))
+    if orig and sale:
+        # 센트 단위 정수 연산: (1 - 0.34/1.00)*100 → 65.99.. 처럼 부동소수 내림 오차 방지
+        o, c = round(orig * 100), round(sale * 100)
+        if o > 0: return max(0, 100 * (o - c) // o)
     return None
 
 # ---------- 데이터 모델 ----------
-@dataclass
+@dataclass(slots=True)  # 카드 100개 → 인스턴스 __dict__ 없이 (Python 3.10+)
 class Product:
     rank: Optional[int]
     brand: str
@@ -76,8 +103,11 @@ class Product:
     url: str
 
 # ---------- 정적 파싱 ----------
+# 정적 HTML에서 필요한 서브트리(베스트 탭/목록)만 트리로 만든다
+BEST_ONLY = SoupStrainer(id=re.compile(r"pillsTab1Nav1|^orderBestProduct$"))
+
 def parse_static_html(html: str) -> List[Product]:
-    soup = BeautifulSoup(html, "lxml")
+    soup = BeautifulSoup(html, "lxml", parse_only=BEST_ONLY)
     container = soup.select_one("#pillsTab1Nav1, [id*='pillsTab1Nav1']")
     root = container or soup
     cards = root.select("ul#orderBestProduct li.order-best-product.prdt-unit")
@@ -92,8 +122,7 @@ def parse_static_html(html: str) -> List[Product]:
         if b: brand = clean_text(b.get_text(" ", strip=True))
 
         a = li.select_one("a[href]")
-        link = a["href"] if (a and a.has_attr("href")) else ""
-        if link.startswith("/"): link = "https://global.oliveyoung.com" + link
+        link = abs_url(a["href"]) if (a and a.has_attr("href")) else ""
 
         rtxt = li.select_one(".rank-badge span, .rank-badge")
         rank = None
@@ -105,11 +134,14 @@ def parse_static_html(html: str) -> List[Product]:
         # 가격: .price-info 전체에서 모든 달러 금액 추출 → sale=min, orig=max
         pbox = li.select_one(".price-info") or li
         ptxt = clean_text(pbox.get_text(" ", strip=True))
-        nums = [parse_price_to_float(x) for x in PRICE_RE.findall(ptxt)]
-        nums = [x for x in nums if x is not None]
+        # 한 번의 스캔으로 min/max 갱신 ("$"가 없는 카드(배너 등)는 정규식 엔진을 돌리지 않음)
         sale = orig = None
-        if len(nums) == 1: sale = nums[0]
-        elif len(nums) >= 2: sale, orig = min(nums), max(nums)
+        if "$" in ptxt:
+            for m in PRICE_RE.finditer(ptxt):
+                v = float(m.group(1).replace(",", ""))
+                if sale is None:   sale = v
+                elif orig is None: sale, orig = min(sale, v), max(sale, v)
+                else:              sale, orig = min(sale, v), max(orig, v)
 
         # 백업 셀렉터
         if sale is None:
@@ -136,20 +168,85 @@ def fetch_by_http() -> List[Product]:
         "Accept-Language": "en-US,en;q=0.9",
         "Cache-Control": "no-cache", "Pragma": "no-cache",
     }
-    r = requests.get(BEST_URL, headers=headers, timeout=25)
+    r = HTTP.get(BEST_URL, headers=headers, timeout=25)
     r.raise_for_status()
     return parse_static_html(r.text)
 
 # ---------- Playwright(강화): Global 전환 + 폴링 대기 ----------
-def fetch_by_playwright() -> List[Product]:
-    from playwright.sync_api import sync_playwright
-    import time, pathlib
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+BLOCKED_HOSTS = ("google-analytics", "googletagmanager", "doubleclick", "facebook.net", "hotjar", "braze")
+
+def is_blocked_request(resource_type: str, url: str) -> bool:
+    # 호스트명만 비교 (1st-party 경로/쿼리에 'braze' 등이 들어가도 차단하지 않음)
+    if resource_type in BLOCKED_RESOURCE_TYPES: return True
+    host = urlparse(url).hostname or ""
+    return any(h in host for h in BLOCKED_HOSTS)
+
+BANNER_CLOSE_BTNS = ["#onetrust-accept-btn-handler", "button:has-text('Accept')", "button:has-text('확인')",
+                     "[aria-label='Close']"]
+BANNER_CLOSE_ANY = ", ".join(BANNER_CLOSE_BTNS) + " >> visible=true"
+REGION_OPENERS = [
+    ".cntry-select-box-wrapper .selected-cntry",
+    "button[aria-haspopup='listbox']",
+    "button:has-text('USA')",
+    "[role='button']:has-text('USA')",
+]
+REGION_GLOBAL_OPTS = ["li[role='option']:has-text('Global')", "li:has-text('Global')", "text=Global"]
+REGION_SELECT = "select.cntry-select-box"
+REGION_OPENER_ANY = ", ".join([REGION_SELECT, *REGION_OPENERS]) + " >> visible=true"
+TOP_ORDERS_TABS = ["[href*='pillsTab1Nav1']", "#pillsTab1Nav1-tab", "[data-bs-target='#pillsTab1Nav1']",
+                   "button:has-text('Top Orders')"]
+CARD_SELS = [
+    "ul#orderBestProduct li.order-best-product.prdt-unit",
+    "#pillsTab1Nav1 ul#orderBestProduct li.order-best-product.prdt-unit",
+    "#pillsTab1Nav1 li.order-best-product.prdt-unit",
+]
+
+# 카드 전체를 한 번의 evaluate로 추출 (필요한 필드만)
+CARD_EXTRACT_JS = """
+(sels) => {
+  const get = (el, s) => (el.querySelector(s)?.textContent || '').replace(/\\s+/g,' ').trim();
+  const PRICE_RE = /(?:US\\$|\\$)\\s*(\\d[\\d,]*(?:\\.\\d+)?|\\.\\d+)/g;  // Python PRICE_RE와 동일
+  // 단일 matchAll 패스에서 개수/최소/최대를 누적 (중간 배열·spread 없음)
+  const priceRange = (t) => {
+    let n=0, lo=Infinity, hi=-Infinity;
+    for (const m of (t||'').matchAll(PRICE_RE)) {
+      const v = parseFloat(m[1].replace(/,/g,''));
+      if (isNaN(v)) continue;
+      n++; if (v<lo) lo=v; if (v>hi) hi=v;
+    }
+    return [n, lo, hi];
+  };
+  let nodes = [];
+  for (const s of sels) { nodes = Array.from(document.querySelectorAll(s)); if (nodes.length >= 10) break; }
+  return nodes.map((el, i) => {
+    const brand = get(el, "dl.brand-info dt, .brand, .brand_name, .brandName");
+    const name  = get(el, "dl.brand-info dd, .prd_name, .name, .product_name");
+    const a     = el.querySelector("a[href]");
+    const link  = a ? a.href : '';
+    const rtxt  = get(el, ".rank-badge span, .rank-badge");
+    const rank  = parseInt((rtxt||'').replace(/[^0-9]/g,'')) || (i+1);
+
+    const pbox  = el.querySelector(".price-info") || el;
+    const ptxt  = (pbox.textContent || '').replace(/\\s+/g,' ').trim();
+    const [n, lo, hi] = priceRange(ptxt);
+    let sale=null, orig=null;
+    if (n===1){ sale=lo; }
+    else if (n>=2){ sale=lo; orig=hi; }
+
+    if (sale==null) sale = parseFloat((get(el, ".price-info .point, .price-info strong, .price-info .sale_price, .price-info .price")||'').replace(/[^\\d.]/g,''))||null;
+    if (orig==null) orig = parseFloat((get(el, ".price-info span, .price-info del")||'').replace(/[^\\d.]/g,''))||null;
+    if (sale==null && orig!=null) sale = orig;
+
+    const pctTxt = get(el, ".price-info .rate, .discount-rate, .percent, .dc");
+    return {rank, brand, name, link, sale, orig, pctTxt};
+  }).filter(x => x.name && x.link);
+}
+"""
 
-    CARD_SELS = [
-        "ul#orderBestProduct li.order-best-product.prdt-unit",
-        "#pillsTab1Nav1 ul#orderBestProduct li.order-best-product.prdt-unit",
-        "#pillsTab1Nav1 li.order-best-product.prdt-unit",
-    ]
+def fetch_by_playwright() -> List[Product]:
+    from playwright.sync_api import sync_playwright, TimeoutError as PWTimeout
+    import pathlib
 
     def _debug_dump(page, tag="global"):
         pathlib.Path("data/debug").mkdir(parents=True, exist_ok=True)
@@ -157,42 +254,53 @@ def fetch_by_playwright() -> List[Product]:
             f.write(page.content())
         page.screenshot(path=f"data/debug/page_{tag}.png", full_page=True)
 
+    def _click_first_visible(page, sels) -> bool:
+        # 우선순위는 유지하되, 없는 셀렉터는 클릭 타임아웃(1.2s) 대신 count() 한 번으로 건너뜀
+        # (등장 대기는 호출 측에서 union 셀렉터로 한 번만)
+        for s in sels:
+            loc = page.locator(f"{s} >> visible=true").first
+            try:
+                if loc.count():
+                    loc.click(timeout=1200)
+                    return True
+            except: pass
+        return False
+
+    def _any_visible(page, sels):
+        # text= 엔진이 섞여 CSS union이 안 되는 목록도 클릭 후보와 같은 요소들로 한 번에 대기
+        loc = page.locator(f"{sels[0]} >> visible=true")
+        for s in sels[1:]:
+            loc = loc.or_(page.locator(f"{s} >> visible=true"))
+        return loc.first
+
     def _force_region_global(page):
-        # 헤더 우측 지역 드롭다운(select 또는 커스텀)
+        # 헤더 우측 지역 드롭다운(select 또는 커스텀): 늦게 hydrate될 수 있어 union으로 한 번만 대기
+        try: page.locator(REGION_OPENER_ANY).first.wait_for(state="visible", timeout=1200)
+        except: pass
         try:
-            sel = page.locator("select.cntry-select-box").first
+            sel = page.locator(REGION_SELECT).first
             if sel.count():
+                # 현재 문서에 표식을 남기고 선택 → 재로딩되면 새 문서엔 표식이 없어 즉시 반환,
+                # 제자리 변경이면 기존 고정 대기(500ms) 한도에서 반환 (이후 카드 수 대기가 마무리)
+                page.evaluate("() => { window.__oyPrevDoc = true; }")
                 sel.select_option(label="Global")
-                page.wait_for_timeout(500)
+                try: page.wait_for_function("() => !window.__oyPrevDoc", polling=100, timeout=500)
+                except PWTimeout: pass
                 return
         except: pass
         # 커스텀 셀렉터(USA → Global)
-        for open_sel in [
-            ".cntry-select-box-wrapper .selected-cntry",
-            "button[aria-haspopup='listbox']",
-            "button:has-text('USA')",
-            "[role='button']:has-text('USA')"
-        ]:
-            try:
-                page.locator(open_sel).first.click(timeout=1200)
-                for opt in ["li[role='option']:has-text('Global')", "li:has-text('Global')", "text=Global"]:
-                    try:
-                        page.locator(opt).first.click(timeout=1200)
-                        return
-                    except: pass
+        for open_sel in REGION_OPENERS:  # 옵션이 안 뜨면 다음 opener 시도
+            if not _click_first_visible(page, [open_sel]): continue
+            try: _any_visible(page, REGION_GLOBAL_OPTS).wait_for(state="visible", timeout=1200)
             except: pass
+            if _click_first_visible(page, REGION_GLOBAL_OPTS): return
         # 내부 탭도 Global(Top Orders)로 클릭
-        for tab_sel in ["[href*='pillsTab1Nav1']", "#pillsTab1Nav1-tab", "[data-bs-target='#pillsTab1Nav1']",
-                        "button:has-text('Top Orders')"]:
-            try:
-                page.locator(tab_sel).first.click(timeout=1200)
-                return
-            except: pass
+        _click_first_visible(page, TOP_ORDERS_TABS)
 
     with sync_playwright() as p:
         browser = p.chromium.launch(
             headless=True,
-            args=["--disable-blink-features=AutomationControlled","--no-sandbox","--disable-dev-shm-usage"],
+            args=["--disable-blink-features=AutomationControlled","--no-sandbox","--disable-dev-shm-usage","--disable-gpu"],
         )
         context = browser.new_context(
             viewport={"width":1366,"height":900},
@@ -202,113 +310,99 @@ def fetch_by_playwright() -> List[Product]:
             extra_http_headers={"Accept-Language":"en-US,en;q=0.9"},
         )
         context.add_init_script("Object.defineProperty(navigator,'webdriver',{get:()=>undefined});")
+        # 이미지/폰트/미디어와 분석·광고 스크립트는 받지 않음 (img src 문자열은 DOM에 그대로 남음)
+        # stylesheet는 드롭다운 클릭/스크롤 레이아웃에 필요하므로 유지
+        context.route("**/*", lambda route: route.abort()
+                      if is_blocked_request(route.request.resource_type, route.request.url) else route.continue_())
 
         page = context.new_page()
-        page.goto(BEST_URL, wait_until="domcontentloaded", timeout=60_000)
-        try: page.wait_for_load_state("networkidle", timeout=30_000)
+        # 응답 수신(commit) 직후 반환 → 전체 DOM 파싱 대신 베스트 목록 컨테이너만 대기
+        page.goto(BEST_URL, wait_until="commit", timeout=60_000)
+        try: page.wait_for_selector("#pillsTab1Nav1, ul#orderBestProduct", state="attached", timeout=30_000)
         except: pass
 
-        # 쿠키/배너 닫기
-        for sel in ["#onetrust-accept-btn-handler","button:has-text('Accept')","button:has-text('확인')","[aria-label='Close']"]:
-            try: page.locator(sel).first.click(timeout=1200)
-            except: pass
+        # 쿠키/배너 닫기: 셀렉터마다 1.2s씩 기다리는 대신 union 셀렉터로 한 번만 대기 후
+        # 기존 우선순위(OneTrust 먼저)대로 셀렉터별 한 번씩만 클릭
+        try: page.locator(BANNER_CLOSE_ANY).first.wait_for(state="visible", timeout=1200)  # 늦게 주입되는 배너 대비
+        except: pass
+        for sel in BANNER_CLOSE_BTNS:
+            _click_first_visible(page, [sel])
 
         _force_region_global(page)
 
-        # 스크롤 + 폴링 (최대 35s)
-        start = time.time(); found = 0
-        while time.time() - start < 35:
-            try: page.mouse.wheel(0, 1400)
-            except: pass
-            for sel in CARD_SELS:
-                try: found = page.eval_on_selector_all(sel, "els => els.length")
-                except: found = 0
-                if found and found >= 10: break
-            if found and found >= 10: break
-            page.wait_for_timeout(800)
-
-        if not (found and found >= 10):
+        # 스크롤+카드 수 확인을 400ms 폴링 predicate 안에서 함께 수행 (최대 35s)
+        # → 재로딩/리다이렉트 후에도 현재 문서에서 계속 스크롤됨
+        try:
+            page.wait_for_function(
+                "(sels) => { window.scrollBy(0, 1400); return sels.some(s => document.querySelectorAll(s).length >= 10); }",
+                arg=CARD_SELS, polling=400, timeout=35_000,
+            )
+            found = True
+        except:
+            found = False
+
+        if not found:
             _debug_dump(page, "global_empty")
             context.close(); browser.close()
             return []
 
         # JS로 필요한 필드만 추출
-        data = page.evaluate("""
-            (sels) => {
-              const get = (el, s) => (el.querySelector(s)?.textContent || '').replace(/\\s+/g,' ').trim();
-              const numsFrom = (t) => Array.from((t||'').matchAll(/(?:US\\$|\\$)\\s*([\\d.,]+)/g))
-                                           .map(m => parseFloat(m[1].replace(/,/g,'')))
-                                           .filter(v=>!isNaN(v));
-              let nodes = [];
-              for (const s of sels) { nodes = Array.from(document.querySelectorAll(s)); if (nodes.length >= 10) break; }
-              return nodes.map((el, i) => {
-                const brand = get(el, "dl.brand-info dt, .brand, .brand_name, .brandName");
-                const name  = get(el, "dl.brand-info dd, .prd_name, .name, .product_name");
-                const a     = el.querySelector("a[href]");
-                const link  = a ? a.href : '';
-                const rtxt  = get(el, ".rank-badge span, .rank-badge");
-                const rank  = parseInt((rtxt||'').replace(/[^0-9]/g,'')) || (i+1);
-
-                const pbox  = el.querySelector(".price-info") || el;
-                const ptxt  = (pbox.textContent || '').replace(/\\s+/g,' ').trim();
-                const arr   = numsFrom(ptxt);
-                let sale=null, orig=null;
-                if (arr.length===1){ sale=arr[0]; }
-                else if (arr.length>=2){ sale=Math.min(...arr); orig=Math.max(...arr); }
-
-                if (sale==null) sale = parseFloat((get(el, ".price-info .point, .price-info strong, .price-info .sale_price, .price-info .price")||'').replace(/[^\\d.]/g,''))||null;
-                if (orig==null) orig = parseFloat((get(el, ".price-info span, .price-info del")||'').replace(/[^\\d.]/g,''))||null;
-                if (sale==null && orig!=null) sale = orig;
-
-                const pctTxt = get(el, ".price-info .rate, .discount-rate, .percent, .dc");
-                return {rank, brand, name, link, sale, orig, pctTxt};
-              }).filter(x => x.name && x.link);
-            }
-        """, CARD_SELS)
+        data = page.evaluate(CARD_EXTRACT_JS, CARD_SELS)
 
         context.close(); browser.close()
 
-    items: List[Product] = []
-    for r in data:
-        items.append(Product(
-            rank=int(r["rank"]),
-            brand=clean_text(r["brand"]),
-            title=clean_text(r["name"]),
-            price=r["sale"],
-            orig_price=r["orig"],
-            discount_percent=discount_floor(r["orig"], r["sale"], r["pctTxt"]),
-            url=r["link"],
-        ))
-    return items
+    return [Product(
+        rank=int(r["rank"]),
+        brand=clean_text(r["brand"]),
+        title=clean_text(r["name"]),
+        price=as_float(r["sale"]),        # JSON 정수(12) → 12.0: CSV 표기를 정적 경로/기존 출력과 통일
+        orig_price=as_float(r["orig"]),
+        discount_percent=discount_floor(r["orig"], r["sale"], r["pctTxt"]),
+        url=r["link"],
+    ) for r in data]
 
 def fetch_products() -> List[Product]:
     try:
-        items = fetch_by_http()
+        items = fetch_by_http(); print(f"[HTTP] 수집: {len(items)}개")
         if len(items) >= 10: return items
     except Exception as e:
-        print("[HTTP 오류] → Playwright 폴백:", e)
+        print("[HTTP 오류]", e)
+    print("[Playwright 폴백 진입]")
     return fetch_by_playwright()
 
 # ---------- Google Drive (국내판 스타일: 단순/안정) ----------
+DRIVE_SIMPLE_UPLOAD_MAX = 5 * 1024 * 1024   # Google 권장 simple upload 상한
+DRIVE_CHUNK_SIZE = 8 * 1024 * 1024
+CSV_MIME = "text/csv"            # CSV만 올리므로 mimetypes 추정 불필요
+DRIVE_NUM_RETRIES = 3            # googleapiclient 내장 지수 백오프(5xx/429)
+
+FOLDER_PATH_RE = re.compile(r"/folders/([a-zA-Z0-9_-]{10,})")
+FOLDER_QUERY_RE = re.compile(r"[?&]id=([a-zA-Z0-9_-]{10,})")
+
 def normalize_folder_id(raw: str) -> str:
     """URL/공백/쿼리스트링이 들어와도 순수 folderId만 추출"""
     if not raw: return ""
     s = raw.strip()
-    m = re.search(r"/folders/([a-zA-Z0-9_-]{10,})", s) or re.search(r"[?&]id=([a-zA-Z0-9_-]{10,})", s)
+    m = FOLDER_PATH_RE.search(s) or FOLDER_QUERY_RE.search(s)
     return (m.group(1) if m else s)
 
-def build_drive_service():
+def drive_credentials():
     """
     OAuth-only. 스코프 미지정(기존 토큰 스코프 사용)으로 invalid_scope 회피.
+    스레드별 서비스가 공유하므로 여기서 한 번 토큰을 갱신해 둔다.
     """
-    from googleapiclient.discovery import build
-    from google.oauth2.credentials import Credentials
-
     cid  = os.getenv("GOOGLE_CLIENT_ID")
     csec = os.getenv("GOOGLE_CLIENT_SECRET")
     rtk  = os.getenv("GOOGLE_REFRESH_TOKEN")
     if not (cid and csec and rtk):
         raise RuntimeError("OAuth 자격정보가 없습니다. GOOGLE_CLIENT_ID/SECRET/REFRESH_TOKEN 확인")
+    return _oauth_credentials(cid, csec, rtk)
+
+@lru_cache(maxsize=1)
+def _oauth_credentials(cid: str, csec: str, rtk: str):
+    """환경변수 값 기준 캐시 (갱신 실패 시 예외는 캐시되지 않음)"""
+    from google.oauth2.credentials import Credentials
+    from google.auth.transport.requests import Request
 
     creds = Credentials(
         None,
@@ -318,33 +412,54 @@ def build_drive_service():
         client_secret=csec,
         # scopes=None  # ← 의도적으로 지정하지 않음
     )
-    svc = build("drive", "v3", credentials=creds, cache_discovery=False)
-    try:
-        about = svc.about().get(fields="user(displayName,emailAddress)").execute()
-        u = about.get("user", {})
-        print(f"[Drive] user={u.get('displayName')} <{u.get('emailAddress')}>")
-    except Exception as e:
-        print("[Drive] whoami 실패:", e)
+    creds.refresh(Request())
+    return creds
+
+def build_drive_service(creds=None, whoami: bool = False):
+    """
+    httplib2는 스레드 안전하지 않으므로 호출(스레드)마다 별도 AuthorizedHttp로 서비스 생성.
+    """
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.discovery import build
+
+    creds = creds or drive_credentials()
+    http = AuthorizedHttp(creds, http=httplib2.Http())
+    # 번들된 discovery 문서 사용 → discovery HTTP 요청 생략
+    svc = build("drive", "v3", http=http, cache_discovery=False, static_discovery=True)
+    if whoami:
+        try:
+            about = svc.about().get(fields="user(displayName,emailAddress)").execute()
+            u = about.get("user", {})
+            print(f"[Drive] user={u.get('displayName')} <{u.get('emailAddress')}>")
+        except Exception as e:
+            print("[Drive] whoami 실패:", e)
     return svc
 
-def drive_upload_csv(service, folder_id: str, name: str, df: pd.DataFrame) -> str:
+def drive_upload_csv(service, folder_id: str, name: str, data: bytes) -> str:
     from googleapiclient.http import MediaIoBaseUpload
     # 동일 파일명 있으면 업데이트, 없으면 생성
     q = f"name = '{name}' and '{folder_id}' in parents and trashed = false"
     res = service.files().list(q=q, fields="files(id,name)",
-                               supportsAllDrives=True, includeItemsFromAllDrives=True).execute()
+                               supportsAllDrives=True, includeItemsFromAllDrives=True
+                               ).execute(num_retries=DRIVE_NUM_RETRIES)
     file_id = res.get("files", [{}])[0].get("id") if res.get("files") else None
 
-    buf = io.BytesIO(); df.to_csv(buf, index=False, encoding="utf-8-sig"); buf.seek(0)
-    media = MediaIoBaseUpload(buf, mimetype="text/csv", resumable=False)
+    buf = io.BytesIO(data)
+    # 5MB 이하는 단일 multipart 요청, 초과 시에만 resumable(8MB 청크)
+    if len(data) > DRIVE_SIMPLE_UPLOAD_MAX:
+        media = MediaIoBaseUpload(buf, mimetype=CSV_MIME, resumable=True, chunksize=DRIVE_CHUNK_SIZE)
+    else:
+        media = MediaIoBaseUpload(buf, mimetype=CSV_MIME, resumable=False)
 
     if file_id:
-        service.files().update(fileId=file_id, media_body=media, supportsAllDrives=True).execute()
+        service.files().update(fileId=file_id, media_body=media,
+                               supportsAllDrives=True).execute(num_retries=DRIVE_NUM_RETRIES)
         return file_id
 
-    meta = {"name": name, "parents": [folder_id], "mimeType": "text/csv"}
+    meta = {"name": name, "parents": [folder_id], "mimeType": CSV_MIME}
     created = service.files().create(body=meta, media_body=media, fields="id",
-                                     supportsAllDrives=True).execute()
+                                     supportsAllDrives=True).execute(num_retries=DRIVE_NUM_RETRIES)
     return created["id"]
 
 def drive_download_csv(service, folder_id: str, name: str) -> Optional[pd.DataFrame]:
@@ -352,36 +467,49 @@ def drive_download_csv(service, folder_id: str, name: str) -> Optional[pd.DataFr
     res = service.files().list(
         q=f"name = '{name}' and '{folder_id}' in parents and trashed = false",
         fields="files(id,name)", supportsAllDrives=True, includeItemsFromAllDrives=True
-    ).execute()
+    ).execute(num_retries=DRIVE_NUM_RETRIES)
     files = res.get("files", [])
     if not files: return None
     fid = files[0]["id"]
     req = service.files().get_media(fileId=fid, supportsAllDrives=True)
     fh = io.BytesIO(); dl = MediaIoBaseDownload(fh, req); done=False
-    while not done: _, done = dl.next_chunk()
-    fh.seek(0); return pd.read_csv(fh)
+    while not done: _, done = dl.next_chunk(num_retries=DRIVE_NUM_RETRIES)
+    # 우리 스키마 컬럼만 파싱 (구버전 파일의 잉여 컬럼은 읽지 않음)
+    fh.seek(0); return pd.read_csv(fh, usecols=lambda c: c in CSV_COLUMNS)
 
 # ---------- Slack ----------
 def slack_post(text: str):
     url = os.getenv("SLACK_WEBHOOK_URL")
     if not url:
         print("[경고] SLACK_WEBHOOK_URL 미설정 → 콘솔 출력\n", text); return
-    r = requests.post(url, json={"text": text}, timeout=20)
+    r = HTTP.post(url, json={"text": text}, timeout=20)
     if r.status_code >= 300:
         print("[Slack 실패]", r.status_code, r.text)
 
 # ---------- 비교/메시지 ----------
+CSV_COLUMNS = ("date", "rank", "brand", "product_name", "price", "orig_price", "discount_percent", "url")
+
+_PRODUCT_FIELDS = attrgetter("rank", "brand", "title", "price", "orig_price", "discount_percent", "url")
+
+def product_row(p: Product, date_str: str) -> Tuple:
+    """CSV_COLUMNS 순서의 위치 기반 행"""
+    return (date_str, *_PRODUCT_FIELDS(p))
+
+CSV_DTYPES = {"price": "float64", "orig_price": "float64", "discount_percent": "Int64"}
+
 def to_dataframe(products: List[Product], date_str: str) -> pd.DataFrame:
-    return pd.DataFrame([{
-        "date": date_str,
-        "rank": p.rank,
-        "brand": p.brand,
-        "product_name": p.title,
-        "price": p.price,
-        "orig_price": p.orig_price,
-        "discount_percent": p.discount_percent,
-        "url": p.url,
-    } for p in products])
+    # 열 단위(SoA)로 모아 dtype 지정 Series로 한 번에 생성 → 셀 단위 추론/astype 복사 없음
+    cols = zip(*map(_PRODUCT_FIELDS, products)) if products else [()] * (len(CSV_COLUMNS) - 1)
+    data = {c: pd.Series(v, dtype=CSV_DTYPES.get(c)) for c, v in zip(CSV_COLUMNS[1:], cols)}
+    return pd.DataFrame({"date": date_str, **data}, columns=list(CSV_COLUMNS))
+
+def to_csv_bytes(products: List[Product], date_str: str) -> bytes:
+    """100행 남짓이라 pandas 대신 csv 모듈로 직접 직렬화"""
+    buf = io.StringIO()
+    wr = csv.writer(buf, lineterminator="\n")
+    wr.writerow(CSV_COLUMNS)
+    wr.writerows(product_row(p, date_str) for p in products)
+    return buf.getvalue().encode("utf-8-sig")
 
 def line_move(name_link: str, prev_rank: Optional[int], curr_rank: Optional[int]) -> Tuple[str, int]:
     if prev_rank is None and curr_rank is not None: return f"- {name_link} NEW → {curr_rank}위", 99999
@@ -403,14 +531,10 @@ def build_sections(df_today: pd.DataFrame, df_prev: Optional[pd.DataFrame]) -> D
 
     # ---------- 전일 rank 맵 (url 기준) ----------
     prev_rank_map: Dict[str, int] = {}
-    if df_prev is not None and len(df_prev):
-        df_p = df_prev.copy()
-        df_p = df_p[(df_p["rank"].notna()) & (df_p["rank"] <= 100)]
-        for _, r in df_p.iterrows():
-            try:
-                prev_rank_map[str(r["url"]).strip()] = int(r["rank"])
-            except:
-                pass
+    if df_prev is not None and len(df_prev) and {"rank", "url"} <= set(df_prev.columns):
+        df_p = df_prev[(df_prev["rank"].notna()) & (df_prev["rank"] <= 100)]
+        # 행 단위 iterrows 대신 컬럼 단위 변환 후 한 번에 dict 생성
+        prev_rank_map = dict(zip(df_p["url"].astype(str).str.strip(), df_p["rank"].astype(int)))
 
     # ---------- TOP10 (등락 배지 포함) ----------
     top10 = df_today.dropna(subset=["rank"]).sort_values("rank").head(10)
@@ -448,55 +572,40 @@ def build_sections(df_today: pd.DataFrame, df_prev: Optional[pd.DataFrame]) -> D
     df_p = df_p[(df_p["rank"].notna()) & (df_p["rank"] <= 100)].copy()
     df_p["key"] = df_p["url"]; df_p.set_index("key", inplace=True)
 
-    common_all = set(df_t.index) & set(df_p.index)
-    new_all    = set(df_t.index) - set(df_p.index)
-    out_all    = set(df_p.index) - set(df_t.index)
-
     def full_name_link(row):
         disp = make_display_name(row.get("brand",""), row.get("product_name",""), include_brand=True)
         return f"<{row['url']}|{slack_escape(disp)}>"
 
+    # 공통 키 순위 변동: 키별 .loc 조회 대신 index join 한 번 + 컬럼 연산으로 후보만 추림
+    moved = df_t.join(df_p[["rank"]].rename(columns={"rank": "prev_rank"}), how="inner")
+    moved["delta"] = moved["prev_rank"] - moved["rank"]
+
+    def move_lines(sub: pd.DataFrame, gaps: pd.Series) -> List[str]:
+        entries = []
+        for gap, row in zip(gaps.astype(int), sub.to_dict("records")):
+            pr, cr = int(row["prev_rank"]), int(row["rank"])
+            line, _ = line_move(full_name_link(row), pr, cr)
+            entries.append((gap, cr, pr, slack_escape(row.get("product_name","")), line))
+        entries.sort(key=lambda x: (-x[0], x[1], x[2], x[3]))
+        return [e[-1] for e in entries[:5]]
+
     # 🔥 급상승 (Top100, +10계단 이상, 최대 5)
-    rising = []
-    for k in common_all:
-        pr, cr = int(df_p.loc[k, "rank"]), int(df_t.loc[k, "rank"])
-        imp = pr - cr
-        if imp >= 10:
-            line, _ = line_move(full_name_link(df_t.loc[k]), pr, cr)
-            rising.append((imp, cr, pr, slack_escape(df_t.loc[k].get("product_name","")), line))
-    rising.sort(key=lambda x: (-x[0], x[1], x[2], x[3]))
-    S["rising"] = [e[-1] for e in rising[:5]]
+    up = moved[moved["delta"] >= 10]
+    S["rising"] = move_lines(up, up["delta"])
 
     # 🆕 뉴랭커 (Top30 신규 진입, 최대 3)
-    t30 = df_t[df_t["rank"] <= 30].copy()
-    p30 = df_p[df_p["rank"] <= 30].copy()
-    newcomers = []
-    for k in (set(t30.index) - set(p30.index)):
-        cr = int(t30.loc[k, "rank"])
-        newcomers.append((cr, f"- {full_name_link(t30.loc[k])} NEW → {cr}위"))
-    newcomers.sort(key=lambda x: x[0])
-    S["newcomers"] = [ln for _, ln in newcomers[:3]]
+    t30 = df_t[df_t["rank"] <= 30]
+    p30 = df_p[df_p["rank"] <= 30]
+    fresh = t30[~t30.index.isin(p30.index)].sort_values("rank", kind="stable").head(3)
+    S["newcomers"] = [f"- {full_name_link(row)} NEW → {int(row['rank'])}위" for row in fresh.to_dict("records")]
 
     # 📉 급하락 (Top100, -10계단 이상, 최대 5)
-    falling = []
-    for k in common_all:
-        pr, cr = int(df_p.loc[k, "rank"]), int(df_t.loc[k, "rank"])
-        drop = cr - pr
-        if drop >= 10:
-            line, _ = line_move(full_name_link(df_t.loc[k]), pr, cr)
-            falling.append((drop, cr, pr, slack_escape(df_t.loc[k].get("product_name","")), line))
-    falling.sort(key=lambda x: (-x[0], x[1], x[2], x[3]))
-    S["falling"] = [e[-1] for e in falling[:5]]
+    down = moved[moved["delta"] <= -10]
+    S["falling"] = move_lines(down, -down["delta"])
 
     # ❌ OUT (전일 1~70 → OUT, 최대 5 / 전일 순위 오름차순)
-    outs = []
-    for k in out_all:
-        pr = int(df_p.loc[k, "rank"])
-        if pr <= 70:
-            line, _ = line_move(full_name_link(df_p.loc[k]), pr, None)
-            outs.append((pr, line))
-    outs.sort(key=lambda x: x[0])
-    S["outs"] = [ln for _, ln in outs[:5]]
+    gone = df_p[~df_p.index.isin(df_t.index) & (df_p["rank"] <= 70)].sort_values("rank", kind="stable").head(5)
+    S["outs"] = [line_move(full_name_link(row), int(row["rank"]), None)[0] for row in gone.to_dict("records")]
 
     # ✅ 인&아웃: Top100 URL 키의 대칭차집합 크기 / 2
     today_top_keys = set(df_t.index)
@@ -520,57 +629,74 @@ def build_slack_message(date_str: str, S: Dict[str, List[str]]) -> str:
     return "\n".join(lines)
 
 # ---------- 메인 ----------
+def drive_load_prev(creds, folder_id: str, name: str) -> Optional[pd.DataFrame]:
+    try:
+        df = drive_download_csv(build_drive_service(creds), folder_id, name)
+        print("전일 CSV", "성공" if df is not None else "미발견")
+        return df
+    except Exception as e:
+        print("Google Drive 다운로드 오류:", e)
+        traceback.print_exc()
+        return None
+
+def drive_upload_today(creds, folder_id: str, name: str, data: bytes):
+    try:
+        drive_upload_csv(build_drive_service(creds, whoami=True), folder_id, name, data)
+        print("Google Drive 업로드 완료:", name)
+    except Exception as e:
+        print("Google Drive 업로드 오류:", e)
+        traceback.print_exc()
+
 def main():
-    date_str = today_kst_str()
-    ymd_yesterday = yesterday_kst_str()
+    now = now_kst()  # 실행당 한 번만 → 자정 경계에서도 오늘/전일이 일관됨
+    date_str = today_kst_str(now)
+    ymd_yesterday = yesterday_kst_str(now)
     file_today = build_filename(date_str)
     file_yesterday = build_filename(ymd_yesterday)
 
-    print("수집 시작:", BEST_URL)
-    items: List[Product] = []
-    try:
-        items = fetch_by_http(); print(f"[HTTP] 수집: {len(items)}개")
-    except Exception as e:
-        print("[HTTP 오류]", e)
-    if len(items) < 10:
-        print("[Playwright 폴백 진입]")
-        items = fetch_by_playwright()
-    print("수집 완료:", len(items))
-    if len(items) < 10:
-        raise RuntimeError("제품 카드가 너무 적게 수집되었습니다. 셀렉터/렌더링 점검 필요")
-
-    df_today = to_dataframe(items, date_str)
-    os.makedirs("data", exist_ok=True)
-    df_today.to_csv(os.path.join("data", file_today), index=False, encoding="utf-8-sig")
-    print("로컬 저장:", file_today)
-
-    # --- Drive 업로드 + 전일 CSV 로드 (국내판 스타일) ---
-    df_prev = None
+    # --- Drive 인증 (국내판 스타일) ---
+    creds = None
     raw_folder = os.getenv("GDRIVE_FOLDER_ID", "")
     folder = normalize_folder_id(raw_folder)
-
     if folder:
+        mask = folder[:4] + "…" + folder[-4:]
+        print(f"[Drive] folder_id={mask} (normalized)")
         try:
-            mask = folder[:4] + "…" + folder[-4:]
-            print(f"[Drive] folder_id={mask} (normalized)")
-            svc = build_drive_service()
-
-            # 곧바로 업로드/다운로드 (프리플라이트 없음)
-            drive_upload_csv(svc, folder, file_today, df_today)
-            print("Google Drive 업로드 완료:", file_today)
-
-            df_prev = drive_download_csv(svc, folder, file_yesterday)
-            print("전일 CSV", "성공" if df_prev is not None else "미발견")
+            creds = drive_credentials()
         except Exception as e:
             print("Google Drive 처리 오류:", e)
             traceback.print_exc()
     else:
         print("[경고] GDRIVE_FOLDER_ID 미설정 → 드라이브 업로드/전일 비교 생략")
 
-    S = build_sections(df_today, df_prev)
-    msg = build_slack_message(date_str, S)
-    slack_post(msg)
-    print("Slack 전송 완료")
+    # 스레드별 서비스로 Drive I/O를 수집/Slack 전송과 겹쳐 실행
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        # 전일 CSV는 수집 결과와 무관 → 수집과 동시에 다운로드
+        prev_fut = pool.submit(drive_load_prev, creds, folder, file_yesterday) if creds else None
+
+        print("수집 시작:", BEST_URL)
+        items = fetch_products()
+        print("수집 완료:", len(items))
+        if len(items) < 10:
+            raise RuntimeError("제품 카드가 너무 적게 수집되었습니다. 셀렉터/렌더링 점검 필요")
+
+        df_today = to_dataframe(items, date_str)
+        # CSV 직렬화는 한 번만: 같은 바이트를 로컬 보관과 Drive 업로드에 재사용
+        csv_bytes = to_csv_bytes(items, date_str)
+        os.makedirs("data", exist_ok=True)
+        with open(os.path.join("data", file_today), "wb") as f: f.write(csv_bytes)
+        print("로컬 저장:", file_today)
+
+        # 업로드는 Slack 전송과 동시에 진행
+        up_fut = pool.submit(drive_upload_today, creds, folder, file_today, csv_bytes) if creds else None
+
+        df_prev = prev_fut.result() if prev_fut else None
+        S = build_sections(df_today, df_prev)
+        msg = build_slack_message(date_str, S)
+        slack_post(msg)
+        print("Slack 전송 완료")
+
+        if up_fut: up_fut.result()
 
 if __name__ == "__main__":
     try: main()
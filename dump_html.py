@@ -32,9 +32,16 @@ async def main():
                 await page.locator(sel).first.click(timeout=1000); break
             except: pass
 
-        # 살짝 스크롤해서 목록 로드
-        for _ in range(10):
-            await page.evaluate("window.scrollBy(0, 1600)"); await page.wait_for_timeout(350)
+        # 살짝 스크롤해서 목록 로드 (브라우저 안에서 한 번에, 바닥 도달 후 변화 없으면 조기 종료)
+        await page.evaluate("""async () => {
+            const sleep = ms => new Promise(r => setTimeout(r, ms));
+            let last = "", stable = 0;
+            for (let i = 0; i < 10 && stable < 2; i++) {
+                window.scrollBy(0, 1600); await sleep(350);
+                const key = window.scrollY + ":" + document.body.scrollHeight;
+                if (key === last) stable++; else { stable = 0; last = key; }
+            }
+        }""")
 
         html = await page.content()
         ts = time.strftime("%Y%m%d_%H%M%S")
@@ -43,5 +50,15 @@ async def main():
         print("[saved]", out_path)
         await ctx.close(); await browser.close()
 
+def use_uvloop() -> bool:
+    """uvloop이 설치돼 있으면 이벤트 루프 정책으로 사용 (없으면 기본 asyncio)"""
+    try:
+        import uvloop
+    except ImportError:
+        return False
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return True
+
 if __name__ == "__main__":
+    use_uvloop()
     asyncio.run(main())